@@ -5,7 +5,6 @@ Use this once to populate electricity_sales table from 2001-01 up to latest avai
 """
 
 from datetime import datetime
-import pandas as pd
 
 from eia_client import fetch_range  # fetch_range returns raw,df
 from supabase_io import upsert_electricity_sales, log_event, save_raw_json  # reuse helpers
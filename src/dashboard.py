@@ -8,10 +8,8 @@ Updated monthly with new EIA data and forecasts.
 import streamlit as st
 import pandas as pd
 from supabase_io import load_electricity_sales, load_forecasts
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from sklearn.metrics import mean_absolute_error, root_mean_squared_error
 import numpy as np
 
 
@@ -31,12 +29,53 @@ st.markdown(
 )
 
 # --- Load data ---
-sales_df = load_electricity_sales()
-forecast_df = load_forecasts()
+# Cached across reruns so slider/filter changes don't re-query Supabase.
+# The monthly columns are derived here once per load, not per rerun:
+# month_str ('YYYY-MM') for plotting, month_code (year*12 + month - 1) for all month arithmetic.
+def _add_month_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df["month_str"] = df["period"].dt.strftime("%Y-%m")
+    df["month_code"] = (df["period"].dt.year * 12 + df["period"].dt.month - 1).astype("int32")
+    return df
 
-# Ensure monthly period format (YYYY-MM)
-sales_df["month"] = sales_df["period"].dt.to_period("M")
-forecast_df["month"] = forecast_df["period"].dt.to_period("M")
+
+def _month_slice(df: pd.DataFrame, start_code, end_code) -> pd.DataFrame:
+    """Rows with start_code <= month_code <= end_code; df must be sorted by period (the loaders ORDER BY period)."""
+    codes = df["month_code"].to_numpy()
+    lo = np.searchsorted(codes, start_code, side="left")
+    hi = np.searchsorted(codes, end_code, side="right")
+    return df.iloc[lo:hi]
+
+
+@st.cache_data(ttl=3600)
+def _load_sales() -> pd.DataFrame:
+    return _add_month_columns(load_electricity_sales().reset_index())
+
+
+@st.cache_data(ttl=3600)
+def _load_forecasts() -> tuple:
+    """
+    All forecasts plus the same rows split per model (each still sorted by period), so rendering
+    never re-scans the full table. Built from one load under one cache entry, so the model list
+    and the per-model split can't come from different refreshes.
+    """
+    df = load_forecasts()
+    # Few distinct model names: categorical makes isin/==/groupby compare integer codes
+    df["model"] = df["model"].astype("category")
+    df = _add_month_columns(df)
+    by_model = {m: g.reset_index(drop=True) for m, g in df.groupby("model", sort=False, observed=True)}
+    return df, by_model
+
+
+@st.cache_data
+def _month_options(min_code: int, max_code: int) -> tuple:
+    """Sorted 'YYYY-MM' labels for every month code from min_code through max_code, and a label -> code lookup."""
+    month_codes = range(min_code, max_code + 1)
+    month_strs = [f"{c // 12:04d}-{c % 12 + 1:02d}" for c in month_codes]
+    return month_strs, dict(zip(month_strs, month_codes))
+
+
+sales_df = _load_sales()
+forecast_df, forecasts_by_model = _load_forecasts()
 
 
 # --- Sidebar controls ---
@@ -51,21 +90,20 @@ selected_models = st.sidebar.multiselect(
 )
 
 # 2. Date range selector
-min_month = sales_df["month"].min()
-max_month = max(sales_df["month"].max(), forecast_df["month"].max())  # cover both actuals and forecasts
-max_month = max_month + 1  # +1 month beyond the last forecast so the line doesn't cut off
+min_code = int(sales_df["month_code"].min())
+max_code = max(int(sales_df["month_code"].max()), int(forecast_df["month_code"].max()))  # cover both actuals and forecasts
+max_code = max_code + 1  # +1 month beyond the last forecast so the line doesn't cut off
 
 # Build sorted list of months as strings
-month_options = pd.period_range(min_month, max_month, freq="M")
-month_strs = month_options.astype(str)
+month_strs, month_code_by_str = _month_options(min_code, max_code)
 
 start_month, end_month = st.sidebar.select_slider(
     "Select Month Range",
     options=month_strs,
     value=(month_strs[-24] if len(month_strs) >= 24 else month_strs[0], month_strs[-1])
 )
-start_month = pd.Period(start_month, freq="M")
-end_month = pd.Period(end_month, freq="M")
+start_code = month_code_by_str[start_month]
+end_code = month_code_by_str[end_month]
 
 # 3. Evaluation period selector
 eval_period = st.sidebar.selectbox(
@@ -81,28 +119,30 @@ period_map = {
 }
 
 # ---- Filter data ----
-sales_df = sales_df[(sales_df["month"] >= start_month) & (sales_df["month"] <= end_month)]
-forecast_df = forecast_df[
-    (forecast_df["month"] >= start_month) & (forecast_df["month"] <= end_month)
-    & (forecast_df["model"].isin(selected_models))
-]
+sales_df = _month_slice(sales_df, start_code, end_code)
+forecasts_by_model = {m: _month_slice(forecasts_by_model[m], start_code, end_code) for m in selected_models}
 
 
 # --- Main Graph: Actuals vs Forecasts ---
-fig = px.line(sales_df, x=sales_df["month"].astype(str), y="sales", title="Electricity Sales vs Forecasts")
-
 # Define a set of colors for the models (adjust as needed)
 model_colors = {available_models[0]: '#EF553B', available_models[1]: '#00CC96'} 
 
-for model in selected_models:
-    model_forecast = forecast_df[forecast_df["model"] == model]
-    fig.add_scatter(x=model_forecast["month"].astype(str), y=model_forecast["forecast"], mode="lines+markers", name=f"{model} Forecast", line=dict(color=model_colors[model]))
+# Build every trace up front and construct the figure once
+traces = [go.Scatter(x=sales_df["month_str"], y=sales_df["sales"], mode="lines", name="Actuals")]
+for model, model_forecast in forecasts_by_model.items():
+    traces.append(
+        go.Scatter(x=model_forecast["month_str"], y=model_forecast["forecast"], mode="lines+markers", name=f"{model} Forecast", line=dict(color=model_colors[model]))
+    )
 
-# dynamic theme colors
-fig.update_layout(
-    template="plotly_dark" if st.get_option("theme.base") == "dark" else "plotly_white",
-    xaxis_title="Month",
-    yaxis_title="Electricity Sales (MWh)",
+fig = go.Figure(
+    data=traces,
+    layout=go.Layout(
+        title="Electricity Sales vs Forecasts",
+        # dynamic theme colors
+        template="plotly_dark" if st.get_option("theme.base") == "dark" else "plotly_white",
+        xaxis_title="Month",
+        yaxis_title="Electricity Sales (MWh)",
+    ),
 )
 
 st.plotly_chart(fig, use_container_width=True)
@@ -112,27 +152,27 @@ st.subheader("Forecast Evaluation Metrics")
 
 # evaluation period
 months_back = period_map[eval_period]
-end_eval = sales_df["month"].max()
+end_eval = sales_df["month_code"].max()
 start_eval = end_eval - months_back + 1
 
-eval_sales = sales_df[(sales_df["month"] >= start_eval) & (sales_df["month"] <= end_eval)]
-eval_forecasts = forecast_df[(forecast_df["month"] >= start_eval) & (forecast_df["month"] <= end_eval)]
-
-# Calculate metrics
-metrics_list = []
-for model in selected_models:
-    merged = eval_sales.merge(
-        eval_forecasts[eval_forecasts["model"] == model],
-        on="month", how="inner"
-    )
-    if len(merged) > 0:
-        mae = mean_absolute_error(merged["sales"], merged["forecast"])
-        rmse = root_mean_squared_error(merged["sales"], merged["forecast"])
-        mape = np.mean(np.abs((merged["sales"] - merged["forecast"]) / merged["sales"])) * 100
-        metrics_list.append({"model": model, "MAE": mae, "RMSE": rmse, "MAPE": mape})
-
-if metrics_list:
-    metrics_df = pd.DataFrame(metrics_list)
+eval_sales = _month_slice(sales_df, start_eval, end_eval)
+eval_slices = [_month_slice(f, start_eval, end_eval) for f in forecasts_by_model.values()]
+eval_forecasts = pd.concat(eval_slices, ignore_index=True) if eval_slices else forecast_df.iloc[:0]
+
+# Calculate metrics: one merge across all selected models, then aggregate per model
+merged = eval_sales.merge(eval_forecasts, on="month_code", how="inner")
+merged["abs_err"] = (merged["sales"] - merged["forecast"]).abs()
+merged["sq_err"] = merged["abs_err"] ** 2
+merged["ape"] = merged["abs_err"] / merged["sales"]
+metrics_df = merged.groupby("model", sort=False, observed=True).agg(
+    MAE=("abs_err", "mean"),
+    RMSE=("sq_err", "mean"),
+    MAPE=("ape", "mean"),
+).reset_index()
+metrics_df["RMSE"] = np.sqrt(metrics_df["RMSE"])
+metrics_df["MAPE"] = metrics_df["MAPE"] * 100
+
+if not metrics_df.empty:
     df_long = metrics_df.melt(
         id_vars=['model'],
         value_vars=['MAE', 'RMSE', 'MAPE'],
@@ -8,8 +8,12 @@ Functions:
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from typing import Tuple, Optional
 
@@ -22,6 +26,21 @@ EIA_BASE = "https://api.eia.gov/v2/electricity/retail-sales/data/"
 if EIA_API_KEY is None:
     raise RuntimeError("EIA_API_KEY not set in .env")
 
+# Shared session so repeated calls reuse the TCP/TLS connection to api.eia.gov
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+    ),
+)
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 30)
+# EIA v2 caps a single response at 5000 rows
+PAGE_LENGTH = 5000
+
 
 def fetch_month(period: str, stateid: str = "NJ", sectorid: str = "RES") -> Tuple[Optional[dict], pd.DataFrame]:
     """
@@ -42,7 +61,7 @@ def fetch_month(period: str, stateid: str = "NJ", sectorid: str = "RES") -> Tupl
         "offset": 0,
         "length": 100
     }
-    resp = requests.get(EIA_BASE, params=params)
+    resp = _SESSION.get(EIA_BASE, params=params, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
     raw = resp.json().get("response", {})
     df = transform_raw_to_df(raw)
@@ -52,6 +71,9 @@ def fetch_month(period: str, stateid: str = "NJ", sectorid: str = "RES") -> Tupl
 def fetch_range(start: str, end: str, stateid: str = "NJ", sectorid: str = "RES") -> Tuple[Optional[dict], pd.DataFrame]:
     """
     Fetch a range of months (start and end as 'YYYY-MM').
+    Pages through the result set until response.total is covered, stepping by the size of the
+    first page (in case EIA serves fewer than PAGE_LENGTH rows per request); pages after the
+    first are fetched concurrently and merged in offset order.
     """
     params = {
         "api_key": EIA_API_KEY,
@@ -64,15 +86,29 @@ def fetch_range(start: str, end: str, stateid: str = "NJ", sectorid: str = "RES"
         "sort[0][column]": "period",
         "sort[0][direction]": "asc",
         "offset": 0,
-        "length": 5000
+        "length": PAGE_LENGTH
     }
-    resp = requests.get(EIA_BASE, params=params)
-    resp.raise_for_status()
-    raw = resp.json().get("response", {})
+    raw = _fetch_page(params, 0)
+    total = int(raw.get("total") or 0)
+    step = len(raw.get("data", [])) or PAGE_LENGTH
+
+    offsets = range(step, total, step)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            pages = list(pool.map(lambda offset: _fetch_page(params, offset), offsets))
+        raw["data"] = raw.get("data", []) + [rec for page in pages for rec in page.get("data", [])]
+
     df = transform_raw_to_df(raw)
     return raw, df
 
 
+def _fetch_page(params: dict, offset: int) -> dict:
+    """Fetch one page of results starting at offset; returns the EIA 'response' dict."""
+    resp = _SESSION.get(EIA_BASE, params={**params, "offset": offset}, timeout=REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json().get("response", {})
+
+
 def transform_raw_to_df(raw: dict) -> pd.DataFrame:
     """
     Transform the EIA 'response' dict into a DataFrame with columns 'period' (datetime) and 'sales'.
@@ -83,14 +119,15 @@ def transform_raw_to_df(raw: dict) -> pd.DataFrame:
     records = raw.get("data", [])
     if not records:
         return pd.DataFrame(columns=["period", "sales"])
-    df = pd.DataFrame(records)
-    # Keep only period & sales (some fields might be named 'sales' already)
-    if "period" not in df.columns or "sales" not in df.columns:
-        # try to detect actual columns
-        # but for safety return empty
+    # Keep only period & sales; bail out if the payload doesn't carry them at all
+    if not any("period" in r for r in records) or not any("sales" in r for r in records):
         return pd.DataFrame(columns=["period", "sales"])
-    df = df[["period", "sales"]].copy()
-    df["period"] = pd.to_datetime(df["period"])
-    df["sales"] = pd.to_numeric(df["sales"], errors="coerce")
-    df = df.sort_values("period").reset_index(drop=True)
-    return df
\ No newline at end of file
+    # Records missing a field become NaT/NaN, as with pd.DataFrame(records)
+    periods = [r.get("period") for r in records]
+    sales = [r.get("sales") for r in records]
+    # Rows arrive sorted by period (the request params ask for ascending order)
+    df = pd.DataFrame({
+        "period": pd.to_datetime(periods, format="%Y-%m", cache=True),
+        "sales": pd.to_numeric(sales, errors="coerce"),
+    })
+    return df
@@ -3,21 +3,58 @@
 """
 Simple script to ping Supabase so the project doesn't get paused.
 Executes a trivial SELECT against the electricity_sales table.
+Talks to the Supabase REST endpoint directly (no pandas / SQLAlchemy / supabase-py)
+so the scheduled run stays cheap to start.
 """
 
-from supabase_io import load_electricity_sales_row, log_event, delete_logs_from_script
-from datetime import datetime
+import os
 import time
+from datetime import datetime
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+if SUPABASE_URL is None or SUPABASE_KEY is None:
+    raise RuntimeError("Please configure SUPABASE_URL and SUPABASE_KEY in .env")
+
+REST_URL = f"{SUPABASE_URL.rstrip('/')}/rest/v1"
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Prefer": "return=minimal",
+}
+TIMEOUT = (5, 30)
 
 script = "keepalive.py"
 
-def main(): 
-    load_electricity_sales_row()
-    log_event(script=script, status="success", details="Keepalive ping successful.")
+def main():
+    # Trivial SELECT: one row from electricity_sales
+    resp = requests.get(f"{REST_URL}/electricity_sales", params={"select": "period", "limit": 1}, headers=HEADERS, timeout=TIMEOUT)
+    resp.raise_for_status()
+
+    # Log the ping, then clean up this script's log rows
+    ts = datetime.now()
+    details = "Keepalive ping successful."
+    resp = requests.post(
+        f"{REST_URL}/logs",
+        json={"timestamp": ts.isoformat(), "script": script, "status": "success", "details": details},
+        headers=HEADERS,
+        timeout=TIMEOUT,
+    )
+    resp.raise_for_status()
+    print(f"[LOG] {ts.isoformat()} | {script} | success | {details}")
+
     time.sleep(2)  # wait a bit before cleanup
-    delete_logs_from_script(script=script)
+    resp = requests.delete(f"{REST_URL}/logs", params={"script": f"eq.{script}"}, headers=HEADERS, timeout=TIMEOUT)
+    resp.raise_for_status()
+    print(f"[LOG] Deleted all logs for script: {script}")
 
     print(f"{datetime.now()}: Keepalive ping executed.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,9 +7,7 @@ Monthly ingest script.
 - Logs all events.
 """
 
-from datetime import timedelta
 from dateutil.relativedelta import relativedelta
-import pandas as pd
 
 from supabase_io import get_latest_period, upsert_electricity_sales, log_event, save_raw_json
 from eia_client import fetch_month
@@ -1,30 +1,35 @@
 # src/monthly_forecast.py
 """
 Monthly forecasting:
-- Load latest model binary + metadata
+- Compare the latest stored period with the model metadata's last_observed
 - If there are new observed months since model.last_observed:
+    - Load the latest model binary and the new observations
     - Append the new observations to the model state (refit=False)
-    - Save updated binary back to storage
-    - Update model metadata.last_observed and updated_at
+    - Save updated binary to a new, versioned storage path
+    - Update model metadata.saved_location, last_observed and updated_at (the commit point),
+      then remove the previous binary
     - Produce 1-step-ahead forecast from the updated model (SARIMA)
     - Produce 1-step seasonal-naive forecast
     - Insert both forecasts into forecasts table
 - If no new data available: log 'no_update' and exit
 """
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dateutil.relativedelta import relativedelta
 import pandas as pd
 
 from supabase_io import (
-    load_electricity_sales,
+    load_electricity_sales_since,
+    get_sales_at,
+    get_latest_period,
     load_model_binary,
-    upsert_model_metadata,
-    append_forecast_record,
-    ensure_model_row,
+    append_forecast_records,
     save_model_binary,
+    cache_model_binary,
+    versioned_model_path,
+    switch_model_binary,
     log_event,
-    get_model_row_by_name,
+    load_model_metadata,
 )
 SCRIPT_NAME = "monthly_forecast.py"
 MODEL_NAME = "sarima_v1"
@@ -33,22 +38,18 @@ BENCHMARK_NAME = "seasonal_naive"
 
 def main():
     try:
-        # Load processed data
-        df = load_electricity_sales()
-        if df.empty:
+        # Latest stored period (cheap MAX(period); rows are only fetched once we know what's new)
+        latest = get_latest_period()
+        if latest is None:
             log_event(SCRIPT_NAME, "error", "No processed electricity data available.")
             return
 
-        # Ensure the benchmark model row exists so forecasts refer to a model id
-        ensure_model_row(BENCHMARK_NAME)
         # Ensure SARIMA model row is present
-        model_row = get_model_row_by_name(MODEL_NAME)
-        if not model_row:
+        meta = load_model_metadata(MODEL_NAME)
+        if not meta:
             log_event(SCRIPT_NAME, "error", f"Model {MODEL_NAME} not found in models table. Train first.")
             return
 
-        # Load model binary and metadata
-        model_obj, meta = load_model_binary(MODEL_NAME)  # returns (model_obj, meta_row_dict)
         last_observed = meta.get("last_observed")
         if last_observed is None:
             # If last_observed not set, use trained_through or earliest available
@@ -58,11 +59,21 @@ def main():
             log_event(SCRIPT_NAME, "error", f"Model {MODEL_NAME} metadata missing last_observed and trained_through.")
             return
 
-        # last_in_model = pd.to_datetime('2025-05-01').date() # for one time backfill, comment out lines 71-86 and revive line 61, 92
+        # One-time backfill (forecast from the stored model without advancing it):
+        #   - replace the assignment below with a fixed date, e.g. last_in_model = pd.to_datetime('2025-05-01').date()
+        #   - replace the model_obj.append(...) statement with `updated_model = model_obj` (see note below)
+        #   - skip the save_model_binary upload (call get_sales_at directly), the switch_model_binary
+        #     call and the cache_model_binary call after the forecast insert
         last_in_model = pd.to_datetime(last_observed).date()
 
-        # Find any new observations since last_in_model
-        new_obs_df = df[df["period"].dt.date > last_in_model].copy()
+        # Nothing newer than the model has seen: stop before any storage download or data fetch
+        if last_in_model >= latest:
+            log_event(SCRIPT_NAME, "no_update", f"No new observations since {last_in_model.strftime('%Y-%m')}. No forecast generated.")
+            return
+
+        # Load model binary and fetch only the observations since last_in_model
+        model_obj, meta = load_model_binary(MODEL_NAME, meta=meta)  # returns (model_obj, meta_row_dict)
+        new_obs_df = load_electricity_sales_since(last_in_model)
 
         if new_obs_df.empty:
             log_event(SCRIPT_NAME, "no_update", f"No new observations since {last_in_model.strftime('%Y-%m')}. No forecast generated.")
@@ -70,39 +81,52 @@ def main():
 
         # Append new observations to fitted model state (no refit)
         # Statsmodels SARIMAXResults has .append(endog, refit=False)
-        series_to_append = pd.Series(new_obs_df["sales"].values, index=new_obs_df["period"], name="sales")
-        updated_model = model_obj.append(series_to_append, refit=False)
-
-        # Save updated model binary back to storage (overwrite)
-        remote_path = save_model_binary(updated_model, MODEL_NAME)
-        # Update metadata: last_observed -> latest period in df
-        new_last = str(df["period"].max().date())
-        meta_update = {
-            "saved_location": remote_path,
-            "last_observed": new_last,
-            # "trained_through": meta.get("trained_through"),  # keep original
-            # "params": meta.get("params"),
-        }
-        upsert_model_metadata(MODEL_NAME, meta_update)
+        updated_model = model_obj.append(new_obs_df["sales"], refit=False)
 
         # Forecast 1-step ahead (next month)
-        latest_period = df["period"].max()
+        latest_period = new_obs_df.index[-1]
         next_period = (latest_period + relativedelta(months=1)).date()
 
-        # updated_model = model_obj  # no new data appended for one time backfill
+        # For the one-time backfill, use `updated_model = model_obj` instead of the append above
 
         sarima_fc = updated_model.forecast(steps=1)
         sarima_val = float(sarima_fc.iloc[0])
-        append_forecast_record(next_period, MODEL_NAME, sarima_val)
-
-        # Seasonal naive: value = value at next_period - 12 months
-        ref_period = (pd.to_datetime(next_period) - pd.DateOffset(months=12)).date()
-        df_idx = df.set_index(df["period"].dt.date)
-        if ref_period in df_idx.index:
-            snaive_val = float(df_idx.loc[ref_period, "sales"])
-        else:
-            snaive_val = None  # missing
-        append_forecast_record(next_period, BENCHMARK_NAME, snaive_val)
+
+        # Save updated model binary under a path versioned by the new last_observed, in the
+        # background while the seasonal-naive lookup runs. The previous binary is left untouched,
+        # so if anything fails before the metadata upsert the models row still matches its binary.
+        new_last = str(latest_period.date())
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            upload = pool.submit(save_model_binary, updated_model, MODEL_NAME, versioned_model_path(MODEL_NAME, new_last))
+
+            # Seasonal naive: value = value at next_period - 12 months (None if missing)
+            ref_period = (pd.to_datetime(next_period) - pd.DateOffset(months=12)).date()
+            snaive_val = get_sales_at(ref_period)
+
+            remote_path, model_bytes = upload.result()
+
+        # Update metadata: last_observed -> latest observed period (switches to the new binary
+        # and removes the previous one)
+        meta_update = {
+            "saved_location": remote_path,
+            "last_observed": new_last,
+            # "trained_through": meta.get("trained_through"),  # keep original
+            # "params": meta.get("params"),
+        }
+        updated_at = switch_model_binary(SCRIPT_NAME, MODEL_NAME, meta_update, meta.get("saved_location"))
+
+        # Insert both forecasts in one transaction (creates the benchmark model row if missing)
+        append_forecast_records([
+            (next_period, MODEL_NAME, sarima_val),
+            (next_period, BENCHMARK_NAME, snaive_val),
+        ])
+
+        # Keep the just-uploaded binary as the locally cached version for the next run. The
+        # upsert above already advanced last_observed, so a cache failure must not fail the run.
+        try:
+            cache_model_binary(MODEL_NAME, updated_at, model_bytes)
+        except OSError as e:
+            log_event(SCRIPT_NAME, "warning", f"Could not cache model binary locally: {e}")
 
         log_event(SCRIPT_NAME, "success", f"Forecasts for {next_period.strftime('%Y-%m')} inserted. Model updated through {new_last}.") 
 
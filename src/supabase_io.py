@@ -7,23 +7,28 @@ Supabase I/O layer (SQLAlchemy + Supabase Storage)
     - electricity_sales (period PK, sales)
     - logs (id, timestamp, script, status, details)
     - forecasts (id, period, model_id -> models.id, forecast, timestamp)
-    - models (id, model_name, saved_location, trained_from, trained_through,
+    - models (id, model_name UNIQUE, saved_location, trained_from, trained_through,
               last_observed, params JSONB, created_at, updated_at)
+- Migration for existing projects whose models table predates the UNIQUE on model_name
+  (required by the ON CONFLICT (model_name) upserts below):
+    ALTER TABLE models ADD CONSTRAINT models_model_name_key UNIQUE (model_name);
 - NOTE: This module expects RLS to be managed separately. We assume scripts
   use the service role key (SUPABASE_KEY) which bypasses RLS.
 """
 
 import os
+import sys
 import json
-import pickle
+import io
+import stat
 from datetime import datetime, date
-from typing import Optional, Dict, Any
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
 
 import pandas as pd
 from sqlalchemy import create_engine, text
-from supabase import create_client
+from sqlalchemy.engine import make_url
 from dotenv import load_dotenv
-import streamlit as st
 
 load_dotenv()
 
@@ -31,15 +36,19 @@ load_dotenv()
 def get_secret(name: str) -> str:
     """
     Fetch secrets in a priority order:
-    1. Streamlit Cloud (st.secrets)
+    1. Streamlit Cloud (st.secrets) -- only when running under Streamlit, so cron scripts
+       don't pay for importing streamlit
     2. Environment variables (.env or GitHub Actions secrets)
     """
-    try:
-        # Attempt to get the secret from Streamlit's secrets
-        return st.secrets[name]
-    except:
-        # Fallback to get the secret from environment variables for other contexts
-        return os.getenv(name)
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        try:
+            # Attempt to get the secret from Streamlit's secrets
+            return st.secrets[name]
+        except:
+            pass
+    # Fallback to get the secret from environment variables for other contexts
+    return os.getenv(name)
 
 DB_URL = get_secret("SUPABASE_DB_URL")
 SUPABASE_URL = get_secret("SUPABASE_URL")
@@ -49,15 +58,38 @@ if DB_URL is None or SUPABASE_URL is None or SUPABASE_KEY is None:
     raise RuntimeError("Please configure SUPABASE_DB_URL, SUPABASE_URL and SUPABASE_KEY in .env")
 
 # create SQLAlchemy engine
-engine = create_engine(DB_URL, future=True)
-
-# supabase client for object storage
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# With psycopg2, batch executemany (list-of-dicts conn.execute calls) into pages of statements
+# per round trip instead of one round trip per row
+engine_kwargs = {}
+if make_url(DB_URL).get_driver_name() == "psycopg2":
+    engine_kwargs = {
+        "executemany_mode": "values_plus_batch",
+        "insertmanyvalues_page_size": 1000,
+        "executemany_batch_page_size": 1000,
+    }
+engine = create_engine(DB_URL, future=True, **engine_kwargs)
+
+# supabase client for object storage (created on first use, see _storage)
+_supabase = None
 
 # storage buckets (create these in Supabase dashboard)
 RAW_BUCKET = "raw-data"
 MODEL_BUCKET = "models"
 
+# local cache of downloaded model binaries (see load_model_binary)
+# Per-user and private (0700): cached files are unpickled on load, so nobody else may write here.
+# Only persistent hosts benefit; on the GitHub Actions runners every run starts with an empty cache.
+MODEL_CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "nj-electricity-forecast" / "models"
+
+
+def _storage():
+    """Return the Supabase Storage API, creating the client on first use."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase.storage
+
 
 # ---------- Logging ----------
 def log_event(script: str, status: str, details: Optional[str] = None) -> None:
@@ -76,19 +108,6 @@ def log_event(script: str, status: str, details: Optional[str] = None) -> None:
         )
     print(f"[LOG] {ts.isoformat()} | {script} | {status} | {details}")
 
-def delete_logs_from_script(script: str) -> None:
-    """
-    Delete all log rows from the logs table for a given script.
-    """
-    with engine.begin() as conn:
-        conn.execute(
-            text("""
-                DELETE FROM logs WHERE script = :script
-            """),
-            {"script": script},
-        )
-    print(f"[LOG] Deleted all logs for script: {script}")
-
 # ---------- Electricity processed data ----------
 def upsert_electricity_sales(df: pd.DataFrame) -> None:
     """
@@ -104,40 +123,59 @@ def upsert_electricity_sales(df: pd.DataFrame) -> None:
     df["period"] = pd.to_datetime(df["period"]).dt.date
     df["sales"] = pd.to_numeric(df["sales"], errors="coerce")
 
+    # One parameter dict per row (NaN -> NULL); passing the list makes SQLAlchemy executemany
+    rows = df[["period", "sales"]].astype(object)
+    params = rows.where(rows.notna(), None).to_dict("records")
+
     with engine.begin() as conn:
-        for _, row in df.iterrows():
-            conn.execute(
-                text("""
-                    INSERT INTO electricity_sales (period, sales)
-                    VALUES (:period, :sales)
-                    ON CONFLICT (period) DO UPDATE SET sales = EXCLUDED.sales
-                """),
-                {"period": row["period"], "sales": float(row["sales"]) if pd.notnull(row["sales"]) else None},
-            )
+        conn.execute(
+            text("""
+                INSERT INTO electricity_sales (period, sales)
+                VALUES (:period, :sales)
+                ON CONFLICT (period) DO UPDATE SET sales = EXCLUDED.sales
+            """),
+            params,
+        )
     print(f"[DATA] Upserted {len(df)} rows into electricity_sales")
 
 
 def load_electricity_sales() -> pd.DataFrame:
-    """Return the entire electricity_sales table as a DataFrame, sorted by period."""
+    """Return the entire electricity_sales table as a DataFrame indexed by period (sorted DatetimeIndex)."""
     with engine.begin() as conn:
-        df = pd.read_sql(text("SELECT period, sales FROM electricity_sales ORDER BY period"), conn)
+        df = pd.read_sql(
+            text("SELECT period, sales FROM electricity_sales ORDER BY period"),
+            conn,
+            index_col="period",
+            parse_dates=["period"],
+        )
     if not df.empty:
-        df["period"] = pd.to_datetime(df["period"])
         df["sales"] = pd.to_numeric(df["sales"])
     return df
 
-def load_electricity_sales_row() -> pd.DataFrame:  
-    """
-    Return one row from the electricity_sales table as a DataFrame.
-    Used to ping Supabase to keep project alive. 
-    """
+def load_electricity_sales_since(since: date) -> pd.DataFrame:
+    """Return electricity_sales rows with period strictly after `since`, indexed by period (sorted DatetimeIndex)."""
     with engine.begin() as conn:
-        df = pd.read_sql(text("SELECT period, sales FROM electricity_sales LIMIT 1"), conn)
+        df = pd.read_sql(
+            text("SELECT period, sales FROM electricity_sales WHERE period > :since ORDER BY period"),
+            conn,
+            params={"since": since},
+            index_col="period",
+            parse_dates=["period"],
+        )
     if not df.empty:
-        df["period"] = pd.to_datetime(df["period"])
         df["sales"] = pd.to_numeric(df["sales"])
     return df
 
+def get_sales_at(period_value: date) -> Optional[float]:
+    """Return the sales value stored for a single period, or None if that month is missing."""
+    with engine.begin() as conn:
+        res = conn.execute(
+            text("SELECT sales FROM electricity_sales WHERE period = :period"), {"period": period_value}
+        ).mappings().first()
+    if res and res["sales"] is not None:
+        return float(res["sales"])
+    return None
+
 def get_latest_period() -> Optional[date]:
     """Return the max(period) in electricity_sales or None if empty."""
     with engine.begin() as conn:
@@ -148,90 +186,44 @@ def get_latest_period() -> Optional[date]:
 
 
 # ---------- Models table helpers ----------
-def get_model_row_by_name(model_name: str) -> Optional[dict]:
-    """Return model row as dict or None if not found."""
-    with engine.begin() as conn:
-        row = conn.execute(text("SELECT * FROM models WHERE model_name = :name"), {"name": model_name}).mappings().first()
-    return dict(row) if row else None
-
-
-def ensure_model_row(model_name: str, created_at: Optional[datetime] = None) -> dict:
-    """
-    Ensure a model row exists. If not, create a minimal placeholder.
-    Returns the model row (as dict).
-    Useful for benchmark models (seasonal_naive) that have no binary.
-    """
-    existing = get_model_row_by_name(model_name)
-    if existing:
-        return existing
-
-    created_at = created_at or datetime.now()
-    with engine.begin() as conn:
-        conn.execute(
-            text("""
-                INSERT INTO models (model_name, created_at, updated_at)
-                VALUES (:name, :created_at, :updated_at)
-            """),
-            {"name": model_name, "created_at": created_at, "updated_at": created_at},
-        )
-        row = conn.execute(text("SELECT * FROM models WHERE model_name = :name"), {"name": model_name}).mappings().first()
-    return dict(row)
-
-
-def upsert_model_metadata(model_name: str, meta: Dict[str, Any]) -> None:
+def upsert_model_metadata(model_name: str, meta: Dict[str, Any]) -> datetime:
     """
     Insert or update metadata in the models table.
     meta may contain: trained_from (date/string), trained_through, last_observed, params (dict), saved_location (text)
-    We upsert by model_name (which is unique by convention).
+    We upsert by model_name (INSERT ... ON CONFLICT, so model_name must carry a unique constraint).
+    Returns the row's new updated_at (the model binary cache key, see cache_model_binary).
     """
     now = datetime.now()
     params_json = json.dumps(meta.get("params")) if meta.get("params") is not None else None
 
-    # Use upsert pattern: if model_name exists -> update, else insert
+    # Single atomic upsert on the unique model_name; COALESCE keeps existing values for omitted fields
     with engine.begin() as conn:
-        # If exists update
-        exists = conn.execute(text("SELECT id FROM models WHERE model_name=:name"), {"name": model_name}).fetchone()
-        if exists:
-            conn.execute(
-                text("""
-                    UPDATE models
-                    SET saved_location = COALESCE(:saved_location, saved_location),
-                        trained_from = COALESCE(:trained_from, trained_from),
-                        trained_through = COALESCE(:trained_through, trained_through),
-                        last_observed = COALESCE(:last_observed, last_observed),
-                        params = COALESCE(:params, params),
-                        updated_at = :updated_at
-                    WHERE model_name = :name
-                """),
-                {
-                    "saved_location": meta.get("saved_location"),
-                    "trained_from": meta.get("trained_from"),
-                    "trained_through": meta.get("trained_through"),
-                    "last_observed": meta.get("last_observed"),
-                    "params": params_json,
-                    "updated_at": now,
-                    "name": model_name,
-                },
-            )
-        else:
-            conn.execute(
-                text("""
-                    INSERT INTO models
-                        (model_name, saved_location, trained_from, trained_through, last_observed, params, created_at, updated_at)
-                    VALUES
-                        (:name, :saved_location, :trained_from, :trained_through, :last_observed, :params::jsonb, :created_at, :updated_at)
-                """),
-                {
-                    "name": model_name,
-                    "saved_location": meta.get("saved_location"),
-                    "trained_from": meta.get("trained_from"),
-                    "trained_through": meta.get("trained_through"),
-                    "last_observed": meta.get("last_observed"),
-                    "params": params_json,
-                    "created_at": now,
-                    "updated_at": now,
-                },
-            )
+        updated_at = conn.execute(
+            text("""
+                INSERT INTO models
+                    (model_name, saved_location, trained_from, trained_through, last_observed, params, created_at, updated_at)
+                VALUES
+                    (:name, :saved_location, :trained_from, :trained_through, :last_observed, CAST(:params AS jsonb), :now, :now)
+                ON CONFLICT (model_name) DO UPDATE
+                SET saved_location = COALESCE(EXCLUDED.saved_location, models.saved_location),
+                    trained_from = COALESCE(EXCLUDED.trained_from, models.trained_from),
+                    trained_through = COALESCE(EXCLUDED.trained_through, models.trained_through),
+                    last_observed = COALESCE(EXCLUDED.last_observed, models.last_observed),
+                    params = COALESCE(EXCLUDED.params, models.params),
+                    updated_at = EXCLUDED.updated_at
+                RETURNING updated_at
+            """),
+            {
+                "name": model_name,
+                "saved_location": meta.get("saved_location"),
+                "trained_from": meta.get("trained_from"),
+                "trained_through": meta.get("trained_through"),
+                "last_observed": meta.get("last_observed"),
+                "params": params_json,
+                "now": now,
+            },
+        ).scalar_one()
+    return updated_at
 
 
 def load_model_metadata(model_name: str) -> Optional[dict]:
@@ -241,68 +233,193 @@ def load_model_metadata(model_name: str) -> Optional[dict]:
     return dict(row) if row else None
 
 
-# ---------- Model binary storage (pickle) ----------
-def save_model_binary(model_obj: object, model_name: str, remote_path: Optional[str] = None) -> str:
+# ---------- Model binary storage (joblib) ----------
+def save_model_binary(model_obj: object, model_name: str, remote_path: Optional[str] = None) -> Tuple[str, bytes]:
     """
-    Serialize the model using pickle.dumps and upload bytes to Supabase Storage.
+    Serialize the model with joblib (zlib level 3, which shrinks the SARIMAX state arrays)
+    and upload bytes to Supabase Storage.
     - model_name: logical name (e.g., 'sarima_v1')
     - remote_path: optional explicit path in bucket, default: '{model_name}.pkl'
-    Returns the saved_location (path) used for metadata.
+    Returns (saved_location used for metadata, uploaded bytes). Pass the bytes to
+    cache_model_binary once switch_model_binary has returned the new updated_at.
     """
+    import joblib
+
     remote_path = remote_path or f"{model_name}.pkl"
-    data = pickle.dumps(model_obj)
+    buf = io.BytesIO()
+    joblib.dump(model_obj, buf, compress=3)
+    data = buf.getvalue()
     # Upload bytes to Supabase storage
-    # NOTE: supabase.storage.from_(bucket).upload signature varies by library version.
+    # NOTE: storage.from_(bucket).upload signature varies by library version.
     # We attempt to upload bytes directly (this is standard accepted usage).
-    supabase.storage.from_(MODEL_BUCKET).upload(remote_path, data, file_options={"content-type": "application/json", "upsert": "true"})
-    return remote_path
+    _storage().from_(MODEL_BUCKET).upload(remote_path, data, file_options={"content-type": "application/json", "upsert": "true"})
+    return remote_path, data
+
+
+def versioned_model_path(model_name: str, last_observed: str) -> str:
+    """
+    Storage path for a new model binary, e.g. 'sarima_v1-2025-06-01-20250710T070512.pkl'.
+    Named after the last period the model has seen plus the upload time, so an upload never
+    overwrites the binary the models row currently points at (see switch_model_binary).
+    """
+    return f"{model_name}-{last_observed}-{datetime.now():%Y%m%dT%H%M%S}.pkl"
+
+
+def delete_model_binary(remote_path: str) -> None:
+    """Remove a model binary from storage (e.g., a version no longer referenced by the models table)."""
+    _storage().from_(MODEL_BUCKET).remove([remote_path])
+
+
+def switch_model_binary(script: str, model_name: str, meta: Dict[str, Any], previous_path: Optional[str]) -> datetime:
+    """
+    Point the models row at a newly uploaded binary (meta['saved_location']) with
+    upsert_model_metadata, which is the commit point, then remove previous_path.
+    Removal is best-effort: a failure is logged as a warning and only leaves an orphan object.
+    Returns the row's new updated_at.
+    """
+    updated_at = upsert_model_metadata(model_name, meta)
+    if previous_path and previous_path != meta.get("saved_location"):
+        try:
+            delete_model_binary(previous_path)
+        except Exception as e:
+            log_event(script, "warning", f"Could not remove previous model binary {previous_path}: {e}")
+    return updated_at
 
 
-def load_model_binary(model_name: str, remote_path: Optional[str] = None):
+def _model_cache_dir_is_private() -> bool:
+    """True if MODEL_CACHE_DIR is a real directory owned by this user and closed to group/others."""
+    try:
+        st = MODEL_CACHE_DIR.lstat()
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+        return False
+    return True
+
+
+def _model_cache_path(model_name: str, updated_at: datetime) -> Path:
+    """Local cache file for a model version, keyed by the models row's updated_at."""
+    return MODEL_CACHE_DIR / f"{model_name}-{updated_at:%Y%m%dT%H%M%S%f}.pkl"
+
+
+def cache_model_binary(model_name: str, updated_at: datetime, data: bytes) -> None:
+    """
+    Store model bytes in the local cache under (model_name, updated_at) and delete older
+    cached versions of the same model, so at most one binary per model is kept on disk.
+    Raises OSError if the cache can't be written; the cache is optional, so callers treat
+    that as a warning rather than a failed run.
     """
-    Download model bytes from storage and unpickle.
+    MODEL_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not _model_cache_dir_is_private():
+        raise PermissionError(f"Model cache dir {MODEL_CACHE_DIR} is not a directory private to this user")
+    local_path = _model_cache_path(model_name, updated_at)
+    # Write to a temp name then rename so a concurrent reader never sees a partial file
+    tmp_path = local_path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, local_path)
+    for stale_path in MODEL_CACHE_DIR.glob(f"{model_name}-*.pkl"):
+        if stale_path != local_path:
+            stale_path.unlink(missing_ok=True)
+
+
+def load_model_binary(model_name: str, remote_path: Optional[str] = None, meta: Optional[dict] = None):
+    """
+    Download model bytes from storage and deserialize with joblib (also reads plain pickles).
     - remote_path: optional; if omitted, will attempt to get location from models table.
+    - meta: optional models row already loaded by the caller (load_model_metadata); skips re-reading it.
+    When the location comes from the models table, the bytes are served from the local cache
+    if it holds the version matching the row's updated_at (and the cache dir is private to this
+    user), and cached after a download otherwise.
     Returns (model_obj, metadata_dict)
     """
-    if remote_path is None:
+    import joblib
+
+    if meta is None:
         meta = load_model_metadata(model_name)
+    updated_at = None
+    if remote_path is None:
         if meta is None or not meta.get("saved_location"):
             raise FileNotFoundError(f"No saved_location found for model {model_name}")
         remote_path = meta["saved_location"]
-
-    # Download bytes
-    data = supabase.storage.from_(MODEL_BUCKET).download(remote_path)
-    model_obj = pickle.loads(data)
-    meta = load_model_metadata(model_name)
+        updated_at = meta.get("updated_at")
+
+    local_path = _model_cache_path(model_name, updated_at) if updated_at is not None else None
+    data = None
+    if local_path is not None and _model_cache_dir_is_private() and local_path.exists():
+        try:
+            data = local_path.read_bytes()
+        except OSError as e:
+            print(f"[CACHE] Could not read cached model {local_path}, downloading instead: {e}")
+    if data is None:
+        # Download bytes
+        data = _storage().from_(MODEL_BUCKET).download(remote_path)
+        if updated_at is not None:
+            try:
+                cache_model_binary(model_name, updated_at, data)
+            except OSError as e:
+                print(f"[CACHE] Could not cache model {model_name}: {e}")
+
+    model_obj = joblib.load(io.BytesIO(data))
     return model_obj, meta
 
 
 # ---------- Forecasts ----------
-def append_forecast_record(period_value: date, model_name: str, forecast_value: Optional[float]) -> None:
+def append_forecast_records(rows: List[Tuple[date, str, Optional[float]]]) -> None:
     """
-    Append a forecast into the forecasts table.
-    - period_value: date for which the forecast is made (use first-of-month date or string 'YYYY-MM-DD')
-    - model_name: lookup model id by name (ensures model row exists)
-    - forecast_value: numeric or None
+    Append forecasts into the forecasts table in one transaction.
+    - rows: (period_value, model_name, forecast_value) tuples
+        - period_value: date for which the forecast is made (use first-of-month date or string 'YYYY-MM-DD')
+        - model_name: lookup model id by name (ensures model row exists)
+        - forecast_value: numeric or None
+    Model ids are resolved with a single SELECT (missing model rows are created with
+    ON CONFLICT DO NOTHING, so a concurrent run creating the same row is harmless) and all
+    forecasts are inserted with one executemany.
     """
-    # Ensure model exists (create minimal if needed)
-    model_row = get_model_row_by_name(model_name)
-    if not model_row:
-        model_row = ensure_model_row(model_name)
-
-    model_id = model_row["id"]
+    if not rows:
+        return
 
+    names = sorted({model_name for _, model_name, _ in rows})
     ts = datetime.now()
     with engine.begin() as conn:
+        id_map = dict(
+            conn.execute(
+                text("SELECT model_name, id FROM models WHERE model_name = ANY(:names)"),
+                {"names": names},
+            ).all()
+        )
+        # Ensure models exist (create minimal rows if needed)
+        missing = [model_name for model_name in names if model_name not in id_map]
+        if missing:
+            conn.execute(
+                text("""
+                    INSERT INTO models (model_name, created_at, updated_at)
+                    VALUES (:name, :ts, :ts)
+                    ON CONFLICT (model_name) DO NOTHING
+                """),
+                [{"name": model_name, "ts": ts} for model_name in missing],
+            )
+            id_map.update(
+                conn.execute(
+                    text("SELECT model_name, id FROM models WHERE model_name = ANY(:names)"),
+                    {"names": missing},
+                ).all()
+            )
+
         conn.execute(
             text("""
                 INSERT INTO forecasts (period, model_id, forecast, timestamp)
                 VALUES (:period, :model_id, :forecast, :ts)
             """),
-            {"period": period_value, "model_id": model_id, "forecast": forecast_value, "ts": ts},
+            [
+                {"period": period_value, "model_id": id_map[model_name], "forecast": forecast_value, "ts": ts}
+                for period_value, model_name, forecast_value in rows
+            ],
         )
 
-    print(f"[FORECAST] model={model_name} period={period_value} forecast={forecast_value}")
+    for period_value, model_name, forecast_value in rows:
+        print(f"[FORECAST] model={model_name} period={period_value} forecast={forecast_value}")
 
 
 def load_forecasts() -> pd.DataFrame:
@@ -327,7 +444,8 @@ def save_raw_json(raw_json: dict, remote_path: str) -> None:
     Save raw JSON dictionary to Supabase Storage under RAW_BUCKET.
     remote_path example: 'backfill/2001_2002.json' or 'monthly/202507.json'
     """
-    raw_bytes = json.dumps(raw_json, default=str).encode("utf-8")
-    supabase.storage.from_(RAW_BUCKET).upload(remote_path, raw_bytes, file_options={"content-type": "application/json", "upsert": "true"})
+    # Compact separators: no whitespace padding in the (multi-page) EIA payload
+    raw_bytes = json.dumps(raw_json, default=str, separators=(",", ":")).encode("utf-8")
+    _storage().from_(RAW_BUCKET).upload(remote_path, raw_bytes, file_options={"content-type": "application/json", "upsert": "true"})
     print(f"[RAW] Uploaded raw JSON to {RAW_BUCKET}/{remote_path}")
 
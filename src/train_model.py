@@ -6,10 +6,16 @@ Train SARIMA model on the entire electricity_sales table and persist model + met
 """
 
 from datetime import datetime
-import pandas as pd
-import statsmodels.api as sm
 
-from supabase_io import load_electricity_sales, save_model_binary, upsert_model_metadata, log_event, ensure_model_row
+from supabase_io import (
+    load_electricity_sales,
+    load_model_metadata,
+    save_model_binary,
+    versioned_model_path,
+    switch_model_binary,
+    cache_model_binary,
+    log_event,
+)
 
 SCRIPT_NAME = "train_model.py"
 MODEL_NAME = "sarima_v1"
@@ -21,34 +27,48 @@ SEASONAL_ORDER = (1, 1, 1, 12)
 
 def main():
     try:
+        # statsmodels (and scipy behind it) is only needed for the fit itself
+        import statsmodels.api as sm
+
         df = load_electricity_sales()
         if df.empty:
             raise RuntimeError("No processed data available. Run backfill/ingest first.")
 
-        y = df.set_index("period")["sales"].astype(float)
+        y = df["sales"].astype(float)
 
         # Fit SARIMA (statsmodels)
+        # concentrate_scale profiles sigma2 out of the likelihood (one fewer parameter to optimize);
+        # low_memory skips the smoother arrays, which forecasting/append(refit=False) don't need
         model = sm.tsa.SARIMAX(y, order=ORDER, seasonal_order=SEASONAL_ORDER,
-                               enforce_stationarity=False, enforce_invertibility=False)
-        fitted = model.fit(disp=False)
+                               enforce_stationarity=False, enforce_invertibility=False,
+                               concentrate_scale=True)
+        fitted = model.fit(disp=False, low_memory=True)
 
-        # Save model binary to storage
-        remote_path = save_model_binary(fitted, MODEL_NAME)  # returns path like 'sarima_v1.pkl'
+        # Save model binary to a new versioned path; the binary the models row points at stays
+        # valid until the metadata upsert below switches to the new one
+        trained_through = str(y.index.max().date())
+        remote_path, model_bytes = save_model_binary(fitted, MODEL_NAME, versioned_model_path(MODEL_NAME, trained_through))
 
         # Prepare metadata
         meta = {
             "saved_location": remote_path,
             "trained_from": str(y.index.min().date()),
-            "trained_through": str(y.index.max().date()), # initial training range
-            "last_observed": str(y.index.max().date()), # same at first, diverges later
+            "trained_through": trained_through, # initial training range
+            "last_observed": trained_through, # same at first, diverges later
             "params": {"order": ORDER, "seasonal_order": SEASONAL_ORDER},
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat(),
         }
 
-        # Ensure model row exists and upsert metadata
-        ensure_model_row(MODEL_NAME)
-        upsert_model_metadata(MODEL_NAME, meta)
+        # Upsert metadata (creates the model row on first train) and remove the previous binary,
+        # then cache the new binary under the new version
+        previous = load_model_metadata(MODEL_NAME)
+        previous_path = previous.get("saved_location") if previous else None
+        updated_at = switch_model_binary(SCRIPT_NAME, MODEL_NAME, meta, previous_path)
+        try:
+            cache_model_binary(MODEL_NAME, updated_at, model_bytes)
+        except OSError as e:
+            log_event(SCRIPT_NAME, "warning", f"Could not cache model binary locally: {e}")
 
         log_event(SCRIPT_NAME, "success", f"Trained model {MODEL_NAME} on {len(y)} rows; saved to {remote_path}")
 